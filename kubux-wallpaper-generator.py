@@ -12,18 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import bisect
 import hashlib
+import io
 import json
 import os
 import math
 import platform
 import queue
 import secrets
+import shutil
 import threading
 import subprocess
 import sys
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 from math import gcd
@@ -33,7 +36,7 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, QPush
                               QVBoxLayout, QHBoxLayout, QGridLayout, QTextEdit,
                               QScrollArea, QSlider, QDialog, QMessageBox, QFrame,
                               QScrollBar, QSizePolicy, QListWidget, QSplitter,
-                              QSpacerItem, QFileDialog, QLayout, QLineEdit)
+                              QSpacerItem, QFileDialog, QLayout, QLineEdit, QProgressBar)
 from PySide6.QtGui import (QPixmap, QImage, QPainter, QColor, QFont, QFontMetrics,
                           QTextCursor, QIcon, QAction, QCursor, QPalette, QGuiApplication)
 from watchdog.events import FileSystemEventHandler, FileClosedNoWriteEvent, FileOpenedEvent
@@ -41,9 +44,15 @@ from watchdog.observers import Observer
 
 from PIL import Image, ImageFile
 ImageFile.LOAD_TRUNCATED_IMAGES = True
+try:
+    import pyvips
+except ImportError:
+    pyvips = None
 from dotenv import load_dotenv
 from together import Together
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 load_dotenv()
 
@@ -52,13 +61,17 @@ load_dotenv()
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 ai_features_enabled = bool(TOGETHER_API_KEY)
 
-SUPPORTED_IMAGE_EXTENSIONS = (
+SUPPORTED_IMAGE_EXTENSIONS = frozenset({
     '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp',
     '.ico', '.icns', '.avif', '.dds', '.msp', '.pcx', '.ppm',
     '.pbm', '.pgm', '.sgi', '.tga', '.xbm', '.xpm'
-)
+})
 
 CACHE_SIZE = 1000
+QT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+FULL_IMAGE_CACHE_SIZE = 16
+# row layout reads the size of every file in a directory: keep well above a gallery's length
+IMAGE_SIZE_CACHE_SIZE = 20000
 
 HOME_DIR = os.path.expanduser('~')
 CONFIG_DIR = os.path.join(HOME_DIR, ".config", "kubux-wallpaper-generator")
@@ -69,6 +82,16 @@ IMAGE_DIR = os.path.join(CONFIG_DIR, "images")
 DEFAULT_THUMBNAIL_DIM = 192
 PROMPT_HISTORY_FILE = os.path.join(CONFIG_DIR, "prompt_history.json")
 APP_SETTINGS_FILE = os.path.join(CONFIG_DIR, "app_settings.json")
+APP_SETTINGS_DEFAULTS = {
+    "ui_scale": 1.0,
+    "window_geometry": None,
+    "thumbnail_scale": 1.0,
+    "horizontal_paned_position": 600,
+    "vertical_paned_position": 400,
+    "model_string": "black-forest-labs/FLUX.1.1-pro",
+    "image_dir": IMAGE_DIR,
+    "gallery_grid_scroll_index": None,
+}
 
 os.makedirs(IMAGE_DIR, exist_ok=True)
 os.makedirs(THUMBNAIL_CACHE_ROOT, exist_ok=True)
@@ -148,21 +171,13 @@ def get_linux_system_ui_font_info():
 
 # --- image ops ---
 
-def resize_image(image, target_width, target_height):
-    original_width, original_height = image.size
+def resize_image(image, target_width, target_height, resample=Image.LANCZOS):
     if target_width <= 0 or target_height <= 0:
         return image.copy()
-    target_aspect = target_width / target_height
-    image_aspect = original_width / original_height
-    if image_aspect > target_aspect:
-        new_width = target_width
-        new_height = int(target_width / image_aspect)
-    else:
-        new_height = target_height
-        new_width = int(target_height * image_aspect)
-    new_width = max(1, new_width)
-    new_height = max(1, new_height)
-    return image.resize((new_width, new_height), resample=Image.LANCZOS)
+    new_size = calculate_thumbnail_dimensions(image.width, image.height, target_width, target_height)
+    if new_size == image.size:
+        return image
+    return image.resize(new_size, resample=resample, reducing_gap=3.0)
 
 def calculate_thumbnail_dimensions(original_width, original_height, target_width, target_height):
     if target_width <= 0 or target_height <= 0:
@@ -177,10 +192,23 @@ def calculate_thumbnail_dimensions(original_width, original_height, target_width
         new_width = int(target_height * image_aspect)
     return max(1, new_width), max(1, new_height)
 
+IMAGE_SIZE_CACHE = OrderedDict()
+
 def get_thumbnail_dimensions(img_path, max_size):
     try:
-        with Image.open(img_path) as img:
-            orig_w, orig_h = img.size
+        mtime_ns = os.stat(img_path).st_mtime_ns
+        cached = IMAGE_SIZE_CACHE.get(img_path)
+        if cached is not None and cached[0] == mtime_ns:
+            IMAGE_SIZE_CACHE.move_to_end(img_path)
+            image_size = cached[1]
+        else:
+            with Image.open(img_path) as img:
+                image_size = img.size
+            IMAGE_SIZE_CACHE[img_path] = (mtime_ns, image_size)
+            IMAGE_SIZE_CACHE.move_to_end(img_path)
+            if len(IMAGE_SIZE_CACHE) > IMAGE_SIZE_CACHE_SIZE:
+                IMAGE_SIZE_CACHE.popitem(last=False)
+        orig_w, orig_h = image_size
         return calculate_thumbnail_dimensions(orig_w, orig_h, max_size, max_size)
     except:
         return max_size, max_size
@@ -200,7 +228,10 @@ def uniq_file_id(img_path, width=-1):
 
 CACHE_LOCK = threading.Lock()
 PIL_CACHE = OrderedDict()
+SCREEN_CACHE = OrderedDict()
 QT_CACHE = OrderedDict()
+QT_CACHE_BYTES = 0
+PREVIEW_CACHE = OrderedDict()
 
 def get_full_size_image(img_path):
     cache_key = uniq_file_id(img_path)
@@ -210,93 +241,191 @@ def get_full_size_image(img_path):
             return PIL_CACHE[cache_key]
     try:
         full_image = Image.open(img_path)
+        full_image.load()
         with CACHE_LOCK:
             PIL_CACHE[cache_key] = full_image
-            if len(PIL_CACHE) > CACHE_SIZE:
+            if len(PIL_CACHE) > FULL_IMAGE_CACHE_SIZE:
                 PIL_CACHE.popitem(last=False)
         return full_image
     except Exception as e:
         log_error(f"Error loading image {img_path}: {e}")
         return None
 
+def get_screen_sized_image(img_path, max_width, max_height, decode=True):
+    cache_key = uniq_file_id(img_path, f"{max_width}x{max_height}")
+    with CACHE_LOCK:
+        if cache_key in SCREEN_CACHE:
+            SCREEN_CACHE.move_to_end(cache_key)
+            return SCREEN_CACHE[cache_key]
+    if not decode:
+        return None
+    try:
+        with Image.open(img_path) as image:
+            screen_image = image
+            if image.width > max_width or image.height > max_height:
+                image.draft("RGB", (max_width, max_height))
+                screen_image = resize_image(image, max_width, max_height)
+            screen_image.load()
+        with CACHE_LOCK:
+            SCREEN_CACHE[cache_key] = screen_image
+            if len(SCREEN_CACHE) > FULL_IMAGE_CACHE_SIZE:
+                SCREEN_CACHE.popitem(last=False)
+        return screen_image
+    except Exception as e:
+        log_error(f"Error loading image {img_path}: {e}")
+        return None
+
+def make_thumbnail(img_path, thumbnail_max_size):
+    if pyvips is not None:
+        try:
+            vips_image = pyvips.Image.thumbnail(img_path, thumbnail_max_size, height=thumbnail_max_size, size="both")
+            return Image.open(io.BytesIO(vips_image.write_to_buffer(".png[compression=1]")))
+        except Exception as e:
+            log_error(f"pyvips could not create thumbnail for {img_path}: {e}")
+    with Image.open(img_path) as image:
+        image.draft("RGB", (2 * thumbnail_max_size, 2 * thumbnail_max_size))
+        thumbnail = resize_image(image, thumbnail_max_size, thumbnail_max_size)
+        thumbnail.load()
+    return thumbnail
+
+THUMBNAIL_CACHE_SUBDIRS = set()
+
 def get_or_make_pil_by_key(cache_key, img_path, thumbnail_max_size):
     thumbnail_size_str = str(thumbnail_max_size)
     thumbnail_cache_subdir = os.path.join(THUMBNAIL_CACHE_ROOT, thumbnail_size_str)
-    os.makedirs(thumbnail_cache_subdir, exist_ok=True)
+    if thumbnail_cache_subdir not in THUMBNAIL_CACHE_SUBDIRS:
+        os.makedirs(thumbnail_cache_subdir, exist_ok=True)
+        THUMBNAIL_CACHE_SUBDIRS.add(thumbnail_cache_subdir)
     cached_thumbnail_path = os.path.join(thumbnail_cache_subdir, f"{cache_key}.png")
     pil_image_thumbnail = None
-    if os.path.exists(cached_thumbnail_path):
-        try:
-            pil_image_thumbnail = Image.open(cached_thumbnail_path)
-        except:
-            pass
+    try:
+        with Image.open(cached_thumbnail_path) as cached_image:
+            cached_image.load()
+        pil_image_thumbnail = cached_image
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_error(f"Could not open cached thumbnail {cached_thumbnail_path}: {e}")
     if pil_image_thumbnail is None:
         try:
-            pil_image_thumbnail = resize_image(get_full_size_image(img_path), thumbnail_max_size, thumbnail_max_size)
+            pil_image_thumbnail = make_thumbnail(img_path, thumbnail_max_size)
             tmp_path = os.path.join(os.path.dirname(cached_thumbnail_path), "tmp-" + os.path.basename(cached_thumbnail_path))
-            pil_image_thumbnail.save(tmp_path)
+            pil_image_thumbnail.save(tmp_path, "PNG", compress_level=1)
             os.replace(tmp_path, cached_thumbnail_path)
         except Exception as e:
             log_error(f"Error creating thumbnail for {img_path}: {e}")
     return pil_image_thumbnail
 
-def pil_to_qpixmap(pil_image):
+def pil_to_qimage(pil_image):
     if pil_image is None:
-        return QPixmap()
+        return QImage()
     if pil_image.mode not in ("RGB", "RGBA"):
-        pil_image = pil_image.convert("RGBA")
+        has_alpha = pil_image.mode in ("LA", "La", "PA", "RGBa") or "transparency" in pil_image.info
+        pil_image = pil_image.convert("RGBA" if has_alpha else "RGB")
     if pil_image.mode == "RGB":
         data = pil_image.tobytes("raw", "RGB")
         qimage = QImage(data, pil_image.width, pil_image.height, 3 * pil_image.width, QImage.Format_RGB888)
     else:
         data = pil_image.tobytes("raw", "RGBA")
         qimage = QImage(data, pil_image.width, pil_image.height, 4 * pil_image.width, QImage.Format_RGBA8888)
-    return QPixmap.fromImage(qimage.copy())
+    return qimage.copy()
 
-def get_or_make_qt_by_key(cache_key, img_path, thumbnail_max_size):
-    with CACHE_LOCK:
-        if cache_key in QT_CACHE:
-            QT_CACHE.move_to_end(cache_key)
-            return QT_CACHE[cache_key]
-    pil_image = get_or_make_pil_by_key(cache_key, img_path, thumbnail_max_size)
-    qt_pixmap = pil_to_qpixmap(pil_image)
+def pil_to_qpixmap(pil_image):
+    return QPixmap.fromImage(pil_to_qimage(pil_image))
+
+def qt_pixmap_bytes(qt_pixmap):
+    return qt_pixmap.width() * qt_pixmap.height() * max(1, qt_pixmap.depth() // 8)
+
+# QPixmaps may only be created on the GUI thread: workers hand over QImages
+def store_qt_by_key(cache_key, qt_pixmap):
+    global QT_CACHE_BYTES
     with CACHE_LOCK:
+        old_pixmap = QT_CACHE.pop(cache_key, None)
+        if old_pixmap is not None:
+            QT_CACHE_BYTES -= qt_pixmap_bytes(old_pixmap)
         QT_CACHE[cache_key] = qt_pixmap
-        if len(QT_CACHE) > CACHE_SIZE:
-            QT_CACHE.popitem(last=False)
-    return qt_pixmap
+        QT_CACHE_BYTES += qt_pixmap_bytes(qt_pixmap)
+        while len(QT_CACHE) > 1 and (len(QT_CACHE) > CACHE_SIZE or QT_CACHE_BYTES > QT_CACHE_MAX_BYTES):
+            _, evicted = QT_CACHE.popitem(last=False)
+            QT_CACHE_BYTES -= qt_pixmap_bytes(evicted)
+
+def drop_cached_images(cache_keys):
+    global QT_CACHE_BYTES
+    with CACHE_LOCK:
+        for cache_key in cache_keys:
+            PIL_CACHE.pop(cache_key, None)
+            SCREEN_CACHE.pop(cache_key, None)
+            PREVIEW_CACHE.pop(cache_key, None)
+            qt_pixmap = QT_CACHE.pop(cache_key, None)
+            if qt_pixmap is not None:
+                QT_CACHE_BYTES -= qt_pixmap_bytes(qt_pixmap)
 
 
 # --- async thumbnail loader ---
 
 class ThumbnailLoader(QObject):
-    thumbnail_ready = Signal(str, QPixmap)
+    thumbnail_ready = Signal(str, QImage)
 
-    def __init__(self, max_workers=4):
+    def __init__(self, max_workers=None):
         super().__init__()
+        if max_workers is None:
+            max_workers = max(2, os.cpu_count() or 1)
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.thumbnail_ready.connect(self._update_button, Qt.QueuedConnection)
+        self.thumbnail_ready.connect(self._queue_update, Qt.QueuedConnection)
         self.buttons = {}
+        self.pending = {}
+        self.ready = deque()
+        self.ready_timer = QTimer(self)
+        self.ready_timer.setSingleShot(True)
+        self.ready_timer.timeout.connect(self._drain_ready)
 
     def _load_async(self, cache_key, img_path, width, button):
         self.buttons[cache_key] = button
-        self.executor.submit(self._generate_thumbnail, cache_key, img_path, width)
+        if cache_key in self.pending:
+            return
+        future = self.executor.submit(self._generate_thumbnail, cache_key, img_path, width)
+        self.pending[cache_key] = future
+        future.add_done_callback(lambda f, k=cache_key: self.pending.pop(k, None))
+
+    def cancel_pending(self):
+        for future in list(self.pending.values()):
+            future.cancel()
+
+    def cancel(self, cache_key):
+        future = self.pending.get(cache_key)
+        if future is not None and future.cancel():
+            self.buttons.pop(cache_key, None)
 
     def _generate_thumbnail(self, cache_key, img_path, width):
         try:
-            pixmap = get_or_make_qt_by_key(cache_key, img_path, width)
-            self.thumbnail_ready.emit(cache_key, pixmap)
+            qimage = pil_to_qimage(get_or_make_pil_by_key(cache_key, img_path, width))
+            self.thumbnail_ready.emit(cache_key, qimage)
         except Exception as e:
             log_error(f"Error generating thumbnail for {img_path}: {e}")
 
-    def _update_button(self, cache_key, pixmap):
-        if cache_key in self.buttons:
-            btn = self.buttons[cache_key]
+    # apply finished thumbnails in small batches so input events get through in between
+    def _queue_update(self, cache_key, qimage):
+        self.ready.append((cache_key, qimage))
+        if not self.ready_timer.isActive():
+            self.ready_timer.start(0)
+
+    def _drain_ready(self):
+        for _ in range(min(8, len(self.ready))):
+            self._update_button(*self.ready.popleft())
+        if self.ready:
+            self.ready_timer.start(0)
+
+    def _update_button(self, cache_key, qimage):
+        pixmap = QPixmap.fromImage(qimage)
+        store_qt_by_key(cache_key, pixmap)
+        btn = self.buttons.pop(cache_key, None)
+        if btn is not None:
             btn.set_image(pixmap)
 
     def load_thumbnail_for_button(self, btn, img_path, width, border):
         cache_key = uniq_file_id(img_path, width)
         btn.cache_key = cache_key
+        btn.thumbnail_width = width
         btn.img_path = img_path
         thumb_w, thumb_h = get_thumbnail_dimensions(img_path, width)
         btn.setFixedSize(thumb_w + 2 * border, thumb_h + 2 * border)
@@ -309,11 +438,13 @@ class ThumbnailLoader(QObject):
 
     def shutdown(self):
         self.buttons.clear()
+        self.ready_timer.stop()
+        self.ready.clear()
         try:
-            self.thumbnail_ready.disconnect(self._update_button)
+            self.thumbnail_ready.disconnect(self._queue_update)
         except TypeError:
             pass
-        self.executor.shutdown(wait=False)
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 # --- dialog ---
@@ -427,36 +558,44 @@ def set_wallpaper(image_path, error_callback=fallback_show_error):
 def unique_name(original_path, category):
     _, ext = os.path.splitext(original_path)
     timestamp_str = datetime.now().strftime('%Y-%m-%d-%H-%M-%S-%f')
-    random_raw_part = secrets.token_urlsafe(18)
-    sanitized_random_part = random_raw_part.replace('/', '_').replace('+', '-')
-    return f"{timestamp_str}_{category}_{sanitized_random_part}{ext}"
+    random_part = secrets.token_urlsafe(18)
+    return f"{timestamp_str}_{category}_{random_part}{ext}"
 
-def is_image_file_name(file_name):
-    return file_name.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS)
+def write_json_atomically(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(data, indent=4))
+    os.replace(tmp_path, path)
+
+def replace_symlink(target, link_path):
+    try:
+        os.symlink(target, link_path)
+    except FileExistsError:
+        os.remove(link_path)
+        os.symlink(target, link_path)
 
-def is_image_file(file_path):
-    return os.path.isfile(file_path) and is_image_file_name(os.path.basename(file_path))
+def is_image_file_name(file_name):
+    dot = file_name.rfind('.')
+    return dot != -1 and file_name[dot:].lower() in SUPPORTED_IMAGE_EXTENSIONS
 
 def list_image_files(directory_path):
-    if not os.path.isdir(directory_path):
+    try:
+        with os.scandir(directory_path) as entries:
+            result = [entry.path for entry in entries if is_image_file_name(entry.name) and entry.is_file()]
+    except OSError:
         return []
-    full_paths = [os.path.join(directory_path, f) for f in os.listdir(directory_path)]
-    result = [p for p in full_paths if is_image_file(p)]
-    result.sort()
-    result.reverse()
+    result.sort(reverse=True)
     return result
 
 def get_parent_directory(path):
     return os.path.dirname(path)
 
 def list_subdirectories(parent_directory_path):
-    if not os.path.isdir(parent_directory_path):
+    try:
+        with os.scandir(parent_directory_path) as entries:
+            subdirs = [entry.path for entry in entries if entry.is_dir()]
+    except OSError:
         return []
-    subdirs = []
-    for item_name in os.listdir(parent_directory_path):
-        item_path = os.path.join(parent_directory_path, item_name)
-        if os.path.isdir(item_path):
-            subdirs.append(item_path)
     subdirs.sort()
     return subdirs
 
@@ -473,7 +612,7 @@ def list_relevant_files(dir_path):
 watch_for_changes = True
 
 class DirectoryEventHandler(QObject, FileSystemEventHandler):
-    directory_changed = Signal()
+    directory_changed = Signal(str)
 
     def __init__(self, directory, on_change_callback):
         QObject.__init__(self)
@@ -485,22 +624,40 @@ class DirectoryEventHandler(QObject, FileSystemEventHandler):
         if isinstance(event, (FileOpenedEvent, FileClosedNoWriteEvent)):
             return
         if watch_for_changes:
-            self.directory_changed.emit()
+            self.directory_changed.emit(event.src_path)
+            if getattr(event, 'dest_path', ''):
+                self.directory_changed.emit(event.dest_path)
 
 
 class DirectoryWatcher():
-    def __init__(self, on_change_callback):
+    def __init__(self, on_change_callback, delay_ms=250):
         self._on_change_callback = on_change_callback
         self.observer = None
+        self._changed_paths = set()
+        # a single download or copy fires many events: report them as one change
+        self._change_timer = QTimer()
+        self._change_timer.setSingleShot(True)
+        self._change_timer.setInterval(delay_ms)
+        self._change_timer.timeout.connect(self._report_changes)
+
+    def _collect_change(self, path):
+        self._changed_paths.add(path)
+        self._change_timer.start()
+
+    def _report_changes(self):
+        changed_paths, self._changed_paths = self._changed_paths, set()
+        self._on_change_callback(changed_paths)
 
     def start_watching(self, directory):
-        self.event_handler = DirectoryEventHandler(directory, self._on_change_callback)
+        self.event_handler = DirectoryEventHandler(directory, self._collect_change)
         self.observer = Observer()
         self.observer.daemon = True
         self.observer.schedule(self.event_handler, directory, recursive=False)
         self.observer.start()
 
     def stop_watching(self):
+        self._change_timer.stop()
+        self._changed_paths.clear()
         if self.observer is not None:
             self.observer.stop()
             self.observer.join()
@@ -594,27 +751,31 @@ def generate_image(prompt, model, width=None, height=None, error_callback=fallba
         error_callback("API Error", f"Failed to generate image: {e}")
         return None
 
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                           max_retries=Retry(total=3, backoff_factor=0.3)))
+
 def download_image(url, file_name, prompt, error_callback=fallback_show_error):
     key = prompt
     prompt_dir = hashlib.sha256(key.encode('utf-8')).hexdigest()
     save_path = os.path.join(DOWNLOAD_DIR, prompt_dir, file_name)
     tmp_save_path = save_path + "-tmp"
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        dir_name = os.path.dirname(save_path)
-        os.makedirs(dir_name, exist_ok=True)
-        prompt_file = os.path.join(dir_name, "prompt.txt")
-        try:
-            with open(prompt_file, 'w') as f:
-                f.write(prompt)
-        except IOError as e:
-            log_error(f"Error writing prompt: {e}")
-        with open(tmp_save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-            f.flush()
-            os.fsync(f.fileno())
+        with HTTP_SESSION.get(url, stream=True, timeout=(5, 30)) as response:
+            response.raise_for_status()
+            dir_name = os.path.dirname(save_path)
+            os.makedirs(dir_name, exist_ok=True)
+            prompt_file = os.path.join(dir_name, "prompt.txt")
+            try:
+                with open(prompt_file, 'w') as f:
+                    f.write(prompt)
+            except IOError as e:
+                log_error(f"Error writing prompt: {e}")
+            with open(tmp_save_path, 'wb') as f:
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+                f.flush()
+                os.fsync(f.fileno())
         os.replace(tmp_save_path, save_path)
     except Exception as e:
         try:
@@ -627,17 +788,13 @@ def download_image(url, file_name, prompt, error_callback=fallback_show_error):
 
     try:
         link_path = os.path.join(DOWNLOAD_DIR, file_name)
-        if os.path.lexists(link_path):
-            os.remove(link_path)
-        os.symlink(save_path, link_path)
+        replace_symlink(save_path, link_path)
     except Exception as e:
         error_callback("File system error", f"Failed to link image: {e}")
 
     try:
         link_path = os.path.join(IMAGE_DIR, file_name)
-        if os.path.lexists(link_path):
-            os.remove(link_path)
-        os.symlink(save_path, link_path)
+        replace_symlink(save_path, link_path)
         return link_path
     except Exception as e:
         error_callback("File system error", f"Failed to link image: {e}")
@@ -660,6 +817,7 @@ class ThumbnailButton(QPushButton):
         self.img_path = None
         self.item_border_width = item_border_width
         self.cache_key = None
+        self.thumbnail_width = None
         self.qt_image = None
         self.setCursor(Qt.PointingHandCursor)
         self.setFocusPolicy(Qt.NoFocus)
@@ -672,6 +830,10 @@ class ThumbnailButton(QPushButton):
                           self.height() - 2 * self.item_border_width)
         self.setIconSize(icon_size)
 
+    def clear_image(self):
+        self.qt_image = None
+        self.setIcon(QIcon())
+
 
 class DirectoryThumbnailGrid:
     def __init__(self, parent_widget, directory_path="",
@@ -683,10 +845,14 @@ class DirectoryThumbnailGrid:
         self._widget_cache = OrderedDict()
         self._cache_size = 1000
         self._active_widgets = {}
+        self._in_use = set()
         self._files = []
+        self._listed_path = None
         self.thumbnail_loader = ThumbnailLoader()
 
     def set_directory_path(self, path):
+        if path == self._listed_path:
+            return False
         self._directory_path = path
         return self.update_file_list()
 
@@ -699,27 +865,80 @@ class DirectoryThumbnailGrid:
         cache_key = uniq_file_id(img_path, width)
         btn = self._widget_cache.get(cache_key, None)
         if btn is None:
-            btn = ThumbnailButton(self._parent_widget, border_width)
-            self.thumbnail_loader.load_thumbnail_for_button(btn, img_path, width, border_width)
+            btn = self._recycle_button()
+            if btn is None:
+                btn = ThumbnailButton(self._parent_widget, border_width)
+                self.thumbnail_loader.load_thumbnail_for_button(btn, img_path, width, border_width)
+                if self._static_button_config_callback:
+                    self._static_button_config_callback(btn, img_path)
+            else:
+                self.thumbnail_loader.load_thumbnail_for_button(btn, img_path, width, border_width)
             self._widget_cache[cache_key] = btn
-            if self._static_button_config_callback:
-                self._static_button_config_callback(btn, img_path)
         else:
             self._widget_cache.move_to_end(cache_key)
-        while len(self._widget_cache) > self._cache_size:
-            self._widget_cache.popitem(last=False)
+            if btn.qt_image is None:
+                self.thumbnail_loader.load_thumbnail_for_button(btn, img_path, width, border_width)
+        return btn
+
+    def touch_button(self, btn):
+        if btn.cache_key in self._widget_cache:
+            self._widget_cache.move_to_end(btn.cache_key)
+
+    def _recycle_button(self):
+        if len(self._widget_cache) < self._cache_size:
+            return None
+        # never take a button that is on screen or already placed in this layout pass
+        for old_key, btn in self._widget_cache.items():
+            if btn not in self._in_use:
+                break
+        else:
+            return None
+        del self._widget_cache[old_key]
+        self.thumbnail_loader.buttons.pop(old_key, None)
+        btn.clear_image()
         return btn
 
+    def trim_cache(self):
+        excess = len(self._widget_cache) - self._cache_size
+        if excess <= 0:
+            return
+        stale_keys = [key for key, btn in self._widget_cache.items() if btn not in self._in_use][:excess]
+        for key in stale_keys:
+            btn = self._widget_cache.pop(key)
+            self.thumbnail_loader.buttons.pop(key, None)
+            btn.deleteLater()
+
     def refresh_buttons(self):
         if self._dynamic_button_config_callback:
             for img_path, btn in self._active_widgets.items():
                 self._dynamic_button_config_callback(btn, img_path)
 
     def update_file_list(self):
+        # files may have changed on disk: make visible buttons revalidate their cache key
+        for btn in self._active_widgets.values():
+            btn.thumbnail_width = None
         old_files = self._files
         self._files = list_image_files(self._directory_path)
+        self._listed_path = self._directory_path
         return self._files != old_files
 
+    def add_file(self, img_path):
+        if img_path in self._files:
+            return False
+        self._files.append(img_path)
+        self._files.sort(reverse=True)
+        return True
+
+    def remove_file(self, img_path):
+        try:
+            self._files.remove(img_path)
+        except ValueError:
+            return False
+        btn = self._active_widgets.pop(img_path, None)
+        if btn is not None:
+            btn.hide()
+        return True
+
 
 ITEM_BORDER_WIDTH = 3
 SPACING = 3
@@ -764,7 +983,12 @@ class ThumbnailArea(QScrollArea):
             static_button_config_callback=static_button_config_callback,
             dynamic_button_config_callback=dynamic_button_config_callback
         )
-        self.refresh_job = None
+        self.refresh_job = QTimer(self)
+        self.refresh_job.setSingleShot(True)
+        self.refresh_job.timeout.connect(self._on_scroll_debounce_helper)
+        self._resize_job = QTimer(self)
+        self._resize_job.setSingleShot(True)
+        self._resize_job.timeout.connect(self._on_resize_debounce_helper)
         self._center_idx = None
         self._rows = 0
         self._row_heights = []
@@ -788,6 +1012,8 @@ class ThumbnailArea(QScrollArea):
         return self.viewport().width()
 
     def set_size_and_path(self, width, path):
+        if width != self._item_width:
+            self.grid.thumbnail_loader.cancel_pending()
         self._item_width = width
         self.grid.set_directory_path(path)
         self._recalculate_grid()
@@ -819,25 +1045,19 @@ class ThumbnailArea(QScrollArea):
     def _find_visible_rows(self, scroll_pos, viewport_height):
         if not self._row_heights or not self._row_y_positions:
             return 0, 0, 0
-        visible_start_row = 0
-        for i in range(len(self._row_heights)):
-            if self._row_y_positions[i] <= scroll_pos:
-                visible_start_row = i
+        rows = len(self._row_heights)
+        visible_start_row = max(0, bisect.bisect_right(self._row_y_positions, scroll_pos, 0, rows) - 1)
         scroll_bottom = scroll_pos + viewport_height
-        visible_end_row = visible_start_row
-        for i in range(visible_start_row, len(self._row_heights)):
-            if self._row_y_positions[i] <= scroll_bottom:
-                visible_end_row = i
+        visible_end_row = max(visible_start_row, bisect.bisect_right(self._row_y_positions, scroll_bottom, 0, rows) - 1)
         visible_middle_row = visible_start_row + ((visible_end_row - visible_start_row) // 2)
         visible_start_row = max(0, visible_start_row - self._buffer_rows)
         visible_end_row = max(0, min(self._rows - 1, visible_end_row + self._buffer_rows))
         return visible_start_row, visible_middle_row, visible_end_row
 
     def _layout_visible_rows(self, cols, scroll_offset):
-        for btn in self.grid._active_widgets.values():
-            if btn is not None:
-                btn.hide()
+        old_widgets = self.grid._active_widgets
         self.grid._active_widgets = {}
+        self.grid._in_use = set(old_widgets.values())
         visible_start_row, visible_middle_row, visible_end_row = self._find_visible_rows(scroll_offset, self._vp_height())
         start_idx = visible_start_row * cols
         end_idx = min((1 + visible_end_row) * cols, len(self.grid._files))
@@ -855,10 +1075,15 @@ class ThumbnailArea(QScrollArea):
             if idx >= len(self.grid._files):
                 break
             img_path = self.grid._files[idx]
-            btn = self.grid.get_button(img_path, self._item_width, self._item_border_width)
+            btn = old_widgets.get(img_path)
+            if btn is not None and btn.thumbnail_width == self._item_width:
+                self.grid.touch_button(btn)
+            else:
+                btn = self.grid.get_button(img_path, self._item_width, self._item_border_width)
             if self.grid._dynamic_button_config_callback:
                 self.grid._dynamic_button_config_callback(btn, img_path)
             self.grid._active_widgets[img_path] = btn
+            self.grid._in_use.add(btn)
             row = idx // cols
             col = idx % cols
             button_width = btn.width()
@@ -870,15 +1095,19 @@ class ThumbnailArea(QScrollArea):
             y = self._row_y_positions[row] - scroll_offset + y_centering_offset
             btn.setGeometry(int(x), int(y), btn.width(), btn.height())
             btn.show()
+        for img_path, btn in old_widgets.items():
+            if btn is not None and self.grid._active_widgets.get(img_path) is not btn:
+                btn.hide()
+                if btn.qt_image is None:
+                    self.grid.thumbnail_loader.cancel(btn.cache_key)
+        self.grid._in_use = set(self.grid._active_widgets.values())
+        self.grid.trim_cache()
 
     def _index_from_scroll_pos(self, scroll_pos):
         if not self._row_heights or not self.grid._files:
             return None
         center_y = scroll_pos + self._vp_height() / 2
-        center_row = 0
-        for i in range(len(self._row_heights)):
-            if self._row_y_positions[i] < center_y:
-                center_row = i
+        center_row = max(0, bisect.bisect_left(self._row_y_positions, center_y, 0, len(self._row_heights)) - 1)
         file_idx = center_row * self._cols
         if file_idx >= len(self.grid._files):
             file_idx = len(self.grid._files) - 1
@@ -915,12 +1144,12 @@ class ThumbnailArea(QScrollArea):
         self._rows = len(self._row_heights)
 
     def _render_viewport(self):
-        for btn in self.grid._active_widgets.values():
-            if btn is not None:
-                btn.hide()
-        self.grid._active_widgets = {}
         self._cols = self._calculate_columns(self._vp_width())
         if not self.grid._files:
+            for btn in self.grid._active_widgets.values():
+                if btn is not None:
+                    btn.hide()
+            self.grid._active_widgets = {}
             self._rows = 0
             self._row_heights = []
             self._row_y_positions = []
@@ -934,16 +1163,15 @@ class ThumbnailArea(QScrollArea):
 
     def _on_scroll(self, value):
         self._scroll_position = value
-        if self.refresh_job:
-            self.refresh_job.stop()
-        self.refresh_job = QTimer()
-        self.refresh_job.setSingleShot(True)
-        self.refresh_job.timeout.connect(self._on_scroll_debounce_helper)
         self.refresh_job.start(50)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        self._recalculate_grid()
+        self._resize_job.start(50)
+
+    def _on_resize_debounce_helper(self):
+        if self._calculate_columns(self._vp_width()) != self._cols:
+            self._recalculate_grid()
         self.move_scrollbar(self._scroll_pos_from_index(self._center_idx))
         self._render_viewport()
 
@@ -988,6 +1216,20 @@ class ThumbnailArea(QScrollArea):
         self.grid.update_file_list()
         self.redraw()
 
+    def add_file(self, img_path):
+        self.add_files([img_path])
+
+    def add_files(self, img_paths):
+        changed = False
+        for img_path in img_paths:
+            changed = self.grid.add_file(img_path) or changed
+        if changed:
+            self.redraw()
+
+    def remove_file(self, img_path):
+        if self.grid.remove_file(img_path):
+            self.redraw()
+
     def shutdown(self):
         if hasattr(self.grid, 'thumbnail_loader'):
             self.grid.thumbnail_loader.shutdown()
@@ -1214,8 +1456,7 @@ class LongMenu(QDialog):
         self._listbox.setMinimumWidth(char_width * max_length)
         self._listbox.setMinimumHeight(20 + fm.height() * min(n_lines, len(self._options)))
 
-        for option_name in other_options:
-            self._listbox.addItem(option_name)
+        self._listbox.addItems(list(other_options))
         if self._options:
             self._listbox.setCurrentRow(0)
 
@@ -1287,6 +1528,7 @@ class BreadCrumNavigator(QWidget):
         self._active_button = None
         self._elide_max_width = 180  # max pixel width for any segment button
         self._segment_data = []  # list of (full_path, original_name)
+        self._shown_layout = None
 
         if font is None:
             self.font = get_font(self)
@@ -1408,6 +1650,11 @@ class BreadCrumNavigator(QWidget):
         self._rebuild_buttons(remaining, dropped, show_dots)
 
     def _rebuild_buttons(self, segments, dropped, show_dots):
+        # most resize events end up with the same segments: keep the widgets
+        layout_key = (tuple(segments), tuple(dropped), show_dots)
+        if layout_key == self._shown_layout:
+            return
+        self._shown_layout = layout_key
         # Clear layout
         while self._layout.count():
             item = self._layout.takeAt(0)
@@ -1524,16 +1771,18 @@ class BreadCrumNavigator(QWidget):
         path = button.path
         selected_path = path
 
-        all_entries = os.listdir(path)
         subdirs = []
         hidden_subdirs = []
-        for entry in all_entries:
-            full_path = os.path.join(path, entry)
-            if os.path.isdir(full_path):
-                if entry.startswith('.'):
-                    hidden_subdirs.append(entry)
-                else:
-                    subdirs.append(entry)
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if entry.name.startswith('.'):
+                            hidden_subdirs.append(entry.name)
+                        else:
+                            subdirs.append(entry.name)
+        except OSError:
+            pass
         subdirs.sort()
         hidden_subdirs.sort()
         sorted_subdirs = subdirs + hidden_subdirs
@@ -1584,7 +1833,7 @@ class ImagePickerDialog(QDialog):
             self.breadcrumb_nav.set_path(self._current_image_dir)
         super().showEvent(event)
 
-    def _on_directory_changed(self):
+    def _on_directory_changed(self, changed_paths):
         self._gallery_grid.regrid()
 
     def _save_settings(self):
@@ -1614,16 +1863,26 @@ class ImagePickerDialog(QDialog):
             self.move(x, y)
 
     def _start_cache_timer(self):
+        self._cache_future = None
         self._cache_timer = QTimer(self)
         self._cache_timer.timeout.connect(self._cache_widget)
         self._cache_timer.start(50)
 
     def _cache_widget(self):
+        if self._cache_future is not None and not self._cache_future.done():
+            return
         try:
             path_name = self.background_worker.path_name_queue.get_nowait()
-            get_or_make_pil_by_key(uniq_file_id(path_name, self._thumbnail_max_size), path_name, self._thumbnail_max_size)
         except queue.Empty:
-            pass
+            return
+        self._cache_future = self._gallery_grid.grid.thumbnail_loader.executor.submit(
+            self._cache_thumbnail, path_name, self._thumbnail_max_size)
+
+    @staticmethod
+    def _cache_thumbnail(path_name, thumbnail_max_size):
+        cache_key = uniq_file_id(path_name, thumbnail_max_size)
+        if cache_key is not None:
+            get_or_make_pil_by_key(cache_key, path_name, thumbnail_max_size)
 
     def _create_widgets(self):
         layout = QVBoxLayout(self)
@@ -1686,19 +1945,29 @@ class ImagePickerDialog(QDialog):
 
     def _configure_picker_button(self, btn, img_path):
         border_color = "blue" if img_path in self.selected_files else "transparent"
-        btn.setStyleSheet(f"padding: 0px; margin: 0px; border: {ITEM_BORDER_WIDTH}px solid {border_color};")
+        if getattr(btn, '_border_color', "transparent") != border_color:
+            btn._border_color = border_color
+            btn.setStyleSheet(f"padding: 0px; margin: 0px; border: {ITEM_BORDER_WIDTH}px solid {border_color};")
         if not getattr(btn, '_picker_signals_connected', False):
             btn._picker_signals_connected = True
-            btn.clicked.connect(lambda checked, p=img_path: self._toggle_selection(p))
+            btn.clicked.connect(self._on_picker_button_clicked)
             btn.setContextMenuPolicy(Qt.CustomContextMenu)
-            btn.customContextMenuRequested.connect(lambda pos, p=img_path: self._show_full_screen(p))
+            btn.customContextMenuRequested.connect(self._on_picker_button_context_menu)
+
+    def _on_picker_button_clicked(self):
+        self._toggle_selection(self.sender().img_path)
+
+    def _on_picker_button_context_menu(self, pos):
+        self._show_full_screen(self.sender().img_path)
 
     def _toggle_selection(self, img_path):
         if img_path in self.selected_files:
             self.selected_files.remove(img_path)
         else:
             self.selected_files.append(img_path)
-        self.refresh_selection()
+        btn = self._gallery_grid.grid._active_widgets.get(img_path)
+        if btn is not None:
+            self._configure_picker_button(btn, img_path)
 
     def _show_full_screen(self, img_path):
         try:
@@ -1730,12 +1999,12 @@ class ImagePickerDialog(QDialog):
         self.refresh_selection()
 
     def refresh_selection(self):
-        self._gallery_grid.redraw()
+        self._gallery_grid.grid.refresh_buttons()
 
     def _on_add_selected(self):
         self.master.add_multiple_images_as_symlinks(self.selected_files)
         self.selected_files = []
-        self._gallery_grid.redraw()
+        self.refresh_selection()
 
     def _on_close(self):
         self._save_settings()
@@ -1755,6 +2024,7 @@ class ImagePickerDialog(QDialog):
 class WallpaperApp(QMainWindow):
     generation_finished = Signal()
     image_ready = Signal(str)
+    preview_decoded = Signal(str)
     error_occurred = Signal(str, str)
 
     def _preview_resize_debounce(self):
@@ -1762,15 +2032,12 @@ class WallpaperApp(QMainWindow):
             self._display_image(self.current_image_path)
 
     def eventFilter(self, obj, event):
-        if obj is self._preview_frame and event.type() == QEvent.Type.Resize and self.current_image_path:
+        # watch the label, not the frame: by its Resize event the layout has already given it the new size
+        if obj is self.preview_image_label and event.type() == QEvent.Type.Resize and self.current_image_path:
             w = event.size().width()
             h = event.size().height()
             if w > 1 and h > 1:
-                if self._preview_resize_timer:
-                    self._preview_resize_timer.stop()
-                self._preview_resize_timer = QTimer()
-                self._preview_resize_timer.setSingleShot(True)
-                self._preview_resize_timer.timeout.connect(self._preview_resize_debounce)
+                self._display_image(self.current_image_path, fast=True)
                 self._preview_resize_timer.start(100)
         return super().eventFilter(obj, event)
 
@@ -1778,23 +2045,49 @@ class WallpaperApp(QMainWindow):
         super().__init__()
         self.generation_finished.connect(self._reset_generate_button)
         self.image_ready.connect(self._load_images_and_select)
+        self.preview_decoded.connect(self._on_preview_decoded)
         self.error_occurred.connect(lambda t, m: custom_message_dialog(self, t, m, font=self.main_font))
         self.setWindowTitle("kubux wallpaper generator")
         self.setMinimumSize(0, 0)
         self.current_image_path = None
-        self._preview_resize_timer = None
+        self._preview_resize_timer = QTimer(self)
+        self._preview_resize_timer.setSingleShot(True)
+        self._preview_resize_timer.timeout.connect(self._preview_resize_debounce)
+        self._ui_scale_timer = QTimer(self)
+        self._ui_scale_timer.setSingleShot(True)
+        self._ui_scale_timer.timeout.connect(self._apply_ui_scale)
+        self._thumbnail_scale_timer = QTimer(self)
+        self._thumbnail_scale_timer.setSingleShot(True)
+        self._thumbnail_scale_timer.timeout.connect(self._apply_thumbnail_scale)
+        self._last_displayed = None
+        self._preview_pixmap = None
+        self._preview_pixmap_path = None
         self.max_history_items = 125
         self.gallery_current_selection = None
         self.gallery_thumbnail_max_size = DEFAULT_THUMBNAIL_DIM
         self._open_pickers = 0
         self._open_picker_dialogs = []
         self._initial_load_done = False
+        self._generation_lock = threading.Lock()
+        # a daemon thread, so that closing the window does not wait for an API call or download
+        self._generation_queue = queue.Queue()
+        self._generation_running = True
+        self._generation_worker = threading.Thread(target=self._generation_loop, name="generation")
+        self._generation_worker.daemon = True
+        self._generation_worker.start()
+        self._preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self._preview_future = None
+        self._wallpaper_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wallpaper")
+        self._prompt_history_save_timer = QTimer(self)
+        self._prompt_history_save_timer.setSingleShot(True)
+        self._prompt_history_save_timer.timeout.connect(self._save_prompt_history)
         self._load_prompt_history()
         self.load_app_settings()
         self.gallery_thumbnail_max_size = int(DEFAULT_THUMBNAIL_DIM * self.current_thumbnail_scale)
         font_name, font_size = get_linux_system_ui_font_info()
         self.base_font_size = font_size
         self.main_font = QFont(font_name, int(self.base_font_size * self.current_font_scale))
+        self.setFont(self.main_font)
         if self.initial_geometry:
             self.restoreGeometry(QByteArray.fromBase64(self.initial_geometry.encode()))
         else:
@@ -1804,38 +2097,41 @@ class WallpaperApp(QMainWindow):
 
     def _load_prompt_history(self):
         try:
-            if os.path.exists(PROMPT_HISTORY_FILE):
-                with open(PROMPT_HISTORY_FILE, 'r') as f:
-                    self.prompt_history = json.load(f)
-            else:
-                self.prompt_history = []
+            with open(PROMPT_HISTORY_FILE, 'r') as f:
+                prompts = json.load(f)
+            if not isinstance(prompts, list):
+                prompts = []
+            # oldest first, so that the most recent prompt is at the end
+            self.prompt_history = OrderedDict.fromkeys(reversed(prompts[:self.max_history_items]))
         except:
-            self.prompt_history = []
+            self.prompt_history = OrderedDict()
 
     def _save_prompt_history(self):
         try:
-            with open(PROMPT_HISTORY_FILE, 'w') as f:
-                json.dump(self.prompt_history, f, indent=4)
+            write_json_atomically(PROMPT_HISTORY_FILE, list(reversed(self.prompt_history)))
         except Exception as e:
             log_error(f"Error saving prompt history: {e}")
 
+    def _schedule_prompt_history_save(self):
+        self._prompt_history_save_timer.start(1000)
+
     def load_app_settings(self):
         try:
-            if os.path.exists(APP_SETTINGS_FILE):
-                with open(APP_SETTINGS_FILE, 'r') as f:
-                    self.app_settings = json.load(f)
-            else:
+            with open(APP_SETTINGS_FILE, 'r') as f:
+                self.app_settings = json.load(f)
+            if not isinstance(self.app_settings, dict):
                 self.app_settings = {}
         except:
             self.app_settings = {}
-        self.current_font_scale = self.app_settings.get("ui_scale", 1.0)
-        self.initial_geometry = self.app_settings.get("window_geometry", None)
-        self.current_thumbnail_scale = self.app_settings.get("thumbnail_scale", 1.0)
-        self.horizontal_paned_position = self.app_settings.get("horizontal_paned_position", 600)
-        self.vertical_paned_position = self.app_settings.get("vertical_paned_position", 400)
-        self.model_string = self.app_settings.get("model_string", "black-forest-labs/FLUX.1.1-pro")
-        self.image_dir = self.app_settings.get("image_dir", IMAGE_DIR)
-        self.gallery_scroll_index = self.app_settings.get("gallery_grid_scroll_index", None)
+        settings = APP_SETTINGS_DEFAULTS | self.app_settings
+        self.current_font_scale = settings["ui_scale"]
+        self.initial_geometry = settings["window_geometry"]
+        self.current_thumbnail_scale = settings["thumbnail_scale"]
+        self.horizontal_paned_position = settings["horizontal_paned_position"]
+        self.vertical_paned_position = settings["vertical_paned_position"]
+        self.model_string = settings["model_string"]
+        self.image_dir = settings["image_dir"]
+        self.gallery_scroll_index = settings["gallery_grid_scroll_index"]
 
     def save_app_settings(self):
         try:
@@ -1858,8 +2154,7 @@ class WallpaperApp(QMainWindow):
                 sizes = self.vertical_splitter.sizes()
                 if len(sizes) >= 2:
                     self.app_settings["vertical_paned_position"] = sizes[0]
-            with open(APP_SETTINGS_FILE, 'w') as f:
-                json.dump(self.app_settings, f, indent=4)
+            write_json_atomically(APP_SETTINGS_FILE, self.app_settings)
         except Exception as e:
             log_error(f"Error saving app settings: {e}")
 
@@ -1901,16 +2196,15 @@ class WallpaperApp(QMainWindow):
 
         # Preview frame (top of left pane)
         self._preview_frame = QFrame()
-        self._preview_frame.installEventFilter(self)
         preview_layout = QVBoxLayout(self._preview_frame)
         preview_layout.setContentsMargins(5, 5, 5, 5)
         preview_label = QLabel("Preview")
-        preview_label.setFont(self.main_font)
         preview_layout.addWidget(preview_label)
         self.preview_image_label = QLabel()
         self.preview_image_label.setAlignment(Qt.AlignCenter)
         self.preview_image_label.setMinimumSize(0, 0)
         self.preview_image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.preview_image_label.installEventFilter(self)
         preview_layout.addWidget(self.preview_image_label, 1)
         self.vertical_splitter.addWidget(self._preview_frame)
 
@@ -1920,10 +2214,8 @@ class WallpaperApp(QMainWindow):
             prompt_layout = QVBoxLayout(prompt_frame)
             prompt_layout.setContentsMargins(5, 5, 5, 5)
             prompt_label = QLabel("Generate New Wallpaper")
-            prompt_label.setFont(self.main_font)
             prompt_layout.addWidget(prompt_label)
             self.prompt_text = QTextEdit()
-            self.prompt_text.setFont(self.main_font)
             self.prompt_text.setMinimumSize(0, 0)
             prompt_layout.addWidget(self.prompt_text, 1)
             self.vertical_splitter.addWidget(prompt_frame)
@@ -1936,7 +2228,6 @@ class WallpaperApp(QMainWindow):
         gallery_layout = QVBoxLayout(gallery_frame)
         gallery_layout.setContentsMargins(5, 5, 5, 5)
         gallery_label = QLabel("Your Wallpaper Collection")
-        gallery_label.setFont(self.main_font)
         gallery_layout.addWidget(gallery_label)
         self.gallery_grid = ThumbnailArea(
             gallery_frame,
@@ -1961,12 +2252,17 @@ class WallpaperApp(QMainWindow):
         gen_layout.setContentsMargins(0, 0, 0, 0)
 
         self.generate_button = QPushButton("Generate")
-        self.generate_button.setFont(self.main_font)
         self.generate_button.clicked.connect(self._on_generate_button_click)
         gen_layout.addWidget(self.generate_button)
 
+        self.generation_progress = QProgressBar()
+        self.generation_progress.setRange(0, 0)
+        self.generation_progress.setTextVisible(False)
+        self.generation_progress.setMaximumWidth(80)
+        self.generation_progress.hide()
+        gen_layout.addWidget(self.generation_progress)
+
         self.history_button = QPushButton("History")
-        self.history_button.setFont(self.main_font)
         self.history_button.clicked.connect(self._show_prompt_history)
         gen_layout.addWidget(self.history_button)
 
@@ -1974,12 +2270,10 @@ class WallpaperApp(QMainWindow):
             self.generate_button.setEnabled(False)
             self.history_button.setEnabled(False)
             self.enable_ai_button = QPushButton("Enable AI Generation")
-            self.enable_ai_button.setFont(self.main_font)
             self.enable_ai_button.clicked.connect(self.show_api_setup_instructions)
             gen_layout.addWidget(self.enable_ai_button)
 
         ui_label = QLabel("UI:")
-        ui_label.setFont(self.main_font)
         gen_layout.addWidget(ui_label)
         self.scale_slider = QSlider(Qt.Horizontal)
         self.scale_slider.setRange(50, 250)
@@ -1989,7 +2283,6 @@ class WallpaperApp(QMainWindow):
         gen_layout.addWidget(self.scale_slider)
 
         thumb_label = QLabel("Thumbs:")
-        thumb_label.setFont(self.main_font)
         gen_layout.addWidget(thumb_label)
         self.thumbnail_scale_slider = QSlider(Qt.Horizontal)
         self.thumbnail_scale_slider.setRange(50, 250)
@@ -1999,17 +2292,14 @@ class WallpaperApp(QMainWindow):
         gen_layout.addWidget(self.thumbnail_scale_slider)
 
         self.delete_button = QPushButton("Delete")
-        self.delete_button.setFont(self.main_font)
         self.delete_button.clicked.connect(self._delete_selected_image)
         gen_layout.addWidget(self.delete_button)
 
         self.add_button = QPushButton("Add")
-        self.add_button.setFont(self.main_font)
         self.add_button.clicked.connect(lambda checked: self._manually_add_images())
         gen_layout.addWidget(self.add_button)
 
         self.set_wallpaper_button = QPushButton("Set Wallpaper")
-        self.set_wallpaper_button.setFont(self.main_font)
         self.set_wallpaper_button.clicked.connect(self._set_current_as_wallpaper)
         gen_layout.addWidget(self.set_wallpaper_button)
 
@@ -2019,7 +2309,6 @@ class WallpaperApp(QMainWindow):
         sel_layout = QHBoxLayout(self.sel_commands_frame)
         sel_layout.setContentsMargins(0, 0, 0, 0)
         sel_ui_label = QLabel("UI:")
-        sel_ui_label.setFont(self.main_font)
         sel_layout.addWidget(sel_ui_label)
         self.sel_scale_slider = QSlider(Qt.Horizontal)
         self.sel_scale_slider.setRange(50, 250)
@@ -2028,7 +2317,6 @@ class WallpaperApp(QMainWindow):
         self.sel_scale_slider.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         sel_layout.addWidget(self.sel_scale_slider)
         sel_thumb_label = QLabel("Thumbs:")
-        sel_thumb_label.setFont(self.main_font)
         sel_layout.addWidget(sel_thumb_label)
         self.sel_thumbnail_scale_slider = QSlider(Qt.Horizontal)
         self.sel_thumbnail_scale_slider.setRange(50, 250)
@@ -2037,7 +2325,6 @@ class WallpaperApp(QMainWindow):
         self.sel_thumbnail_scale_slider.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         sel_layout.addWidget(self.sel_thumbnail_scale_slider)
         sel_add_btn = QPushButton("Add")
-        sel_add_btn.setFont(self.main_font)
         sel_add_btn.clicked.connect(lambda checked: self._manually_add_images())
         sel_layout.addWidget(sel_add_btn)
         self.sel_commands_frame.hide()
@@ -2066,15 +2353,54 @@ class WallpaperApp(QMainWindow):
         self.gallery_grid.move_scrollbar(self.gallery_grid._scroll_pos_from_index(self.gallery_scroll_index))
         self.gallery_grid._render_viewport()
 
-    def _on_image_dir_changed(self):
-        self._load_images()
+    def _on_image_dir_changed(self, changed_paths):
+        # our own additions and deletions are already in the grid: only apply what differs
+        grid = self.gallery_grid.grid
+        known = set(grid._files)
+        added, removed, stale_keys = [], [], []
+        for path in changed_paths:
+            if os.path.dirname(path) != IMAGE_DIR or not is_image_file_name(os.path.basename(path)):
+                continue
+            exists = os.path.isfile(path)
+            if path not in known:
+                if exists:
+                    added.append(path)
+                continue
+            btn = grid._active_widgets.get(path)
+            if exists:
+                # rewritten in place or relinked under the same name: rebuild its button and row
+                if btn is not None:
+                    unchanged = btn.cache_key == uniq_file_id(path, btn.thumbnail_width)
+                else:
+                    cached_size = IMAGE_SIZE_CACHE.get(path)
+                    unchanged = cached_size is None or cached_size[0] == os.stat(path).st_mtime_ns
+                if unchanged:
+                    continue
+                added.append(path)
+            removed.append(path)
+            if btn is not None and btn.cache_key is not None:
+                stale_keys.append(btn.cache_key)
+        drop_cached_images(stale_keys)
+        changed = False
+        for path in removed:
+            changed = grid.remove_file(path) or changed
+        for path in added:
+            changed = grid.add_file(path) or changed
+        if changed:
+            self.gallery_grid.redraw()
 
     def _gallery_configure_button(self, btn, img_path):
         if not getattr(btn, '_gallery_signals_connected', False):
             btn._gallery_signals_connected = True
-            btn.clicked.connect(lambda checked, p=img_path: self._gallery_on_thumbnail_click(p))
+            btn.clicked.connect(self._gallery_on_button_clicked)
             btn.setContextMenuPolicy(Qt.CustomContextMenu)
-            btn.customContextMenuRequested.connect(lambda pos, p=img_path: self._gallery_on_thumbnail_click_right(p))
+            btn.customContextMenuRequested.connect(self._gallery_on_button_context_menu)
+
+    def _gallery_on_button_clicked(self):
+        self._gallery_on_thumbnail_click(self.sender().img_path)
+
+    def _gallery_on_button_context_menu(self, pos):
+        self._gallery_on_thumbnail_click_right(self.sender().img_path)
 
     def show_api_setup_instructions(self):
         instructions = """
@@ -2092,59 +2418,95 @@ class WallpaperApp(QMainWindow):
         self.current_font_scale = scale
         self.scale_slider.setValue(value)
         self.sel_scale_slider.setValue(value)
-        new_size = int(self.base_font_size * scale)
+        self._ui_scale_timer.start(80)
+
+    def _apply_ui_scale(self):
+        new_size = int(self.base_font_size * self.current_font_scale)
         self.main_font.setPointSize(new_size)
-        self._update_all_fonts()
+        self.setFont(self.main_font)
 
-    def _update_all_fonts(self):
-        def update_widget_fonts(widget, font):
-            if hasattr(widget, 'setFont'):
-                try:
-                    widget.setFont(font)
-                except:
-                    pass
-            for child in widget.findChildren(QWidget):
-                if hasattr(child, 'setFont'):
-                    try:
-                        child.setFont(font)
-                    except:
-                        pass
-        update_widget_fonts(self, self.main_font)
-
-    def _display_image(self, image_path):
+    def _display_image(self, image_path, fast=False):
         try:
-            full_img = get_full_size_image(image_path)
-            if full_img is None:
-                import time
-                time.sleep(0.15)
-                full_img = get_full_size_image(image_path)
-            if full_img is None:
-                return
             fw = self.preview_image_label.width()
             fh = self.preview_image_label.height()
+            try:
+                mtime = os.stat(image_path).st_mtime_ns
+            except OSError:
+                mtime = None
+            display_key = (image_path, mtime, fw, fh)
+            if display_key == self._last_displayed:
+                return
+            if fast and self._preview_pixmap is not None and self._preview_pixmap_path == image_path:
+                if fw > 1 and fh > 1:
+                    self.preview_image_label.setPixmap(
+                        self._preview_pixmap.scaled(fw, fh, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+                    self._last_displayed = None
+                return
             if fw <= 1 or fh <= 1:
                 return
-            resized_img = resize_image(full_img, fw, fh)
-            pixmap = pil_to_qpixmap(resized_img)
+            cache_key = None if fast else uniq_file_id(image_path, f"{fw}x{fh}")
+            pixmap = PREVIEW_CACHE.get(cache_key) if cache_key else None
+            if pixmap is not None:
+                PREVIEW_CACHE.move_to_end(cache_key)
+            else:
+                screen_size = self.screen().size()
+                full_img = get_screen_sized_image(image_path, screen_size.width(), screen_size.height(), decode=False)
+                if full_img is None:
+                    self._request_preview_decode(image_path, screen_size.width(), screen_size.height())
+                    return
+                resized_img = resize_image(full_img, fw, fh, Image.BILINEAR if fast else Image.LANCZOS)
+                pixmap = pil_to_qpixmap(resized_img)
+                if cache_key is not None:
+                    PREVIEW_CACHE[cache_key] = pixmap
+                    if len(PREVIEW_CACHE) > FULL_IMAGE_CACHE_SIZE:
+                        PREVIEW_CACHE.popitem(last=False)
             self.preview_image_label.setPixmap(pixmap)
             self.current_image_path = image_path
+            if fast:
+                self._last_displayed = None
+            else:
+                self._last_displayed = display_key
+                self._preview_pixmap = pixmap
+                self._preview_pixmap_path = image_path
         except Exception as e:
             log_error(f"Error displaying image: {e}")
             self.current_image_path = None
+            self._last_displayed = None
+
+    def _request_preview_decode(self, image_path, screen_width, screen_height):
+        if self._preview_future is not None:
+            self._preview_future.cancel()
+        self._preview_future = self._preview_executor.submit(
+            self._decode_preview, image_path, screen_width, screen_height)
+
+    def _decode_preview(self, image_path, screen_width, screen_height):
+        full_img = get_screen_sized_image(image_path, screen_width, screen_height)
+        if full_img is None:
+            time.sleep(0.15)
+            full_img = get_screen_sized_image(image_path, screen_width, screen_height)
+        if full_img is not None:
+            self.preview_decoded.emit(image_path)
+
+    def _on_preview_decoded(self, image_path):
+        if image_path == self.current_image_path:
+            self._display_image(image_path)
 
     def broadcast_contents_change(self):
         if hasattr(self, 'gallery_grid'):
             self.gallery_grid.regrid()
 
-    def _load_images(self):
-        self.gallery_grid.regrid()
-
     def _gallery_update_thumbnail_scale_callback(self, value):
         scale = value / 100.0
         self.thumbnail_scale_slider.setValue(value)
         self.sel_thumbnail_scale_slider.setValue(value)
         self.current_thumbnail_scale = scale
-        self.gallery_thumbnail_max_size = int(DEFAULT_THUMBNAIL_DIM * scale)
+        new_size = int(DEFAULT_THUMBNAIL_DIM * scale)
+        if new_size == self.gallery_thumbnail_max_size:
+            return
+        self.gallery_thumbnail_max_size = new_size
+        self._thumbnail_scale_timer.start(200)
+
+    def _apply_thumbnail_scale(self):
         self.gallery_grid.set_size_and_path(self.gallery_thumbnail_max_size, IMAGE_DIR)
 
     def _gallery_on_thumbnail_click(self, image_path):
@@ -2158,11 +2520,11 @@ class WallpaperApp(QMainWindow):
         self._delete_image(image_path)
 
     def _add_prompt_to_history(self, prompt):
-        if prompt in self.prompt_history:
-            self.prompt_history.remove(prompt)
-        self.prompt_history.insert(0, prompt)
-        self.prompt_history = self.prompt_history[:self.max_history_items]
-        self._save_prompt_history()
+        self.prompt_history.pop(prompt, None)
+        self.prompt_history[prompt] = None
+        while len(self.prompt_history) > self.max_history_items:
+            self.prompt_history.popitem(last=False)
+        self._schedule_prompt_history_save()
 
     def _show_prompt_history(self):
         if not self.prompt_history:
@@ -2172,10 +2534,14 @@ class WallpaperApp(QMainWindow):
         dialog.setWindowTitle("Prompt History")
         dialog.resize(600, 400)
         layout = QVBoxLayout(dialog)
+        filter_edit = QLineEdit()
+        filter_edit.setFont(self.main_font)
+        filter_edit.setPlaceholderText("Filter prompts")
+        layout.addWidget(filter_edit)
         listbox = QListWidget()
         listbox.setFont(self.main_font)
-        for prompt in self.prompt_history:
-            listbox.addItem(prompt)
+        listbox.addItems(list(reversed(self.prompt_history)))
+        filter_edit.textChanged.connect(lambda text: self._filter_prompt_history(listbox, text))
         listbox.itemDoubleClicked.connect(lambda item: self._select_prompt_from_history(listbox, dialog))
         layout.addWidget(listbox, 1)
         btn_layout = QHBoxLayout()
@@ -2190,6 +2556,12 @@ class WallpaperApp(QMainWindow):
         layout.addLayout(btn_layout)
         dialog.exec()
 
+    def _filter_prompt_history(self, listbox, text):
+        query = text.lower()
+        for row in range(listbox.count()):
+            item = listbox.item(row)
+            item.setHidden(query not in item.text().lower())
+
     def _select_prompt_from_history(self, listbox, dialog):
         items = listbox.selectedItems()
         if items:
@@ -2201,56 +2573,84 @@ class WallpaperApp(QMainWindow):
         if not prompt:
             custom_message_dialog(self, "Input Error", "Please enter a prompt.", font=self.main_font)
             return
+        if not self._generation_lock.acquire(blocking=False):
+            return
         self._add_prompt_to_history(prompt)
         self.generate_button.setText("Generating...")
         self.generate_button.setEnabled(False)
+        self.generation_progress.show()
         # Compute dimensions on main thread — QScreen not safe from worker threads
         width, height = good_dimensions()
-        threading.Thread(target=self._run_generation_task, args=(prompt, width, height), daemon=True).start()
+        screen_size = self.screen().size()
+        self._generation_queue.put((prompt, width, height, screen_size.width(), screen_size.height(),
+                                    self.gallery_thumbnail_max_size))
+
+    def _generation_loop(self):
+        while self._generation_running:
+            task = self._generation_queue.get()
+            if task is None:
+                return
+            self._run_generation_task(*task)
 
-    def _run_generation_task(self, prompt, width, height):
+    def _run_generation_task(self, prompt, width, height, screen_width, screen_height, thumbnail_max_size):
         def error_dialog(title, message):
-            self.error_occurred.emit(title, message)
-        image_url = generate_image(prompt, model=self.model_string, width=width, height=height, error_callback=error_dialog)
-        if image_url:
-            file_name = unique_name("dummy.png", "generated")
-            save_path = download_image(image_url, file_name, prompt, error_callback=error_dialog)
-            if save_path:
-                self.image_ready.emit(save_path)
-        self.generation_finished.emit()
+            if self._generation_running:
+                self.error_occurred.emit(title, message)
+        try:
+            image_url = generate_image(prompt, model=self.model_string, width=width, height=height, error_callback=error_dialog)
+            if image_url:
+                file_name = unique_name("dummy.png", "generated")
+                save_path = download_image(image_url, file_name, prompt, error_callback=error_dialog)
+                if save_path:
+                    # decode while still off the UI thread; the preview and the gallery then hit the caches
+                    get_screen_sized_image(save_path, screen_width, screen_height)
+                    thumbnail_key = uniq_file_id(save_path, thumbnail_max_size)
+                    if thumbnail_key is not None:
+                        get_or_make_pil_by_key(thumbnail_key, save_path, thumbnail_max_size)
+                    if self._generation_running:
+                        self.image_ready.emit(save_path)
+        finally:
+            self._generation_lock.release()
+            if self._generation_running:
+                self.generation_finished.emit()
 
     def _reset_generate_button(self):
         self.generate_button.setText("Generate")
         self.generate_button.setEnabled(True)
+        self.generation_progress.hide()
 
     def _load_images_and_select(self, path_to_select):
-        self._load_images()
+        self.gallery_grid.add_file(path_to_select)
         self.gallery_grid.move_scrollbar(self.gallery_grid.verticalScrollBar().maximum())
         self._gallery_on_thumbnail_click(path_to_select)
 
     def add_multiple_images_as_symlinks(self, original_paths):
         if not original_paths:
             return
+        linked_targets = set()
+        try:
+            with os.scandir(IMAGE_DIR) as entries:
+                for entry in entries:
+                    if entry.is_symlink():
+                        linked_targets.add(os.path.realpath(entry.path))
+        except OSError as e:
+            log_error(f"Failed to list {IMAGE_DIR}: {e}")
+        added_paths = []
         for file_path in original_paths:
             try:
                 if not os.path.exists(file_path):
                     continue
+                real_path = os.path.realpath(file_path)
+                if real_path in linked_targets:
+                    continue
                 file_name = unique_name(file_path, "manual")
                 dest = os.path.join(IMAGE_DIR, file_name)
-                is_already_linked = False
-                for existing_linked_file in os.listdir(IMAGE_DIR):
-                    full_existing_link_path = os.path.join(IMAGE_DIR, existing_linked_file)
-                    if os.path.islink(full_existing_link_path) and os.path.realpath(full_existing_link_path) == os.path.realpath(file_path):
-                        is_already_linked = True
-                        break
-                if is_already_linked:
-                    continue
-                if os.path.lexists(dest):
-                    os.remove(dest)
-                os.symlink(file_path, dest)
+                replace_symlink(file_path, dest)
+                linked_targets.add(real_path)
+                added_paths.append(dest)
             except Exception as e:
                 log_error(f"Failed to add image: {e}")
-        self._load_images()
+        self.gallery_grid.add_files(added_paths)
 
     def _manually_add_images(self, directory=None):
         if directory is None:
@@ -2285,13 +2685,28 @@ class WallpaperApp(QMainWindow):
         return default_dir
 
     def _delete_image(self, path_to_delete):
-        if path_to_delete and os.path.exists(path_to_delete):
+        if path_to_delete:
             try:
-                os.remove(path_to_delete)
+                # the keys depend on the file's mtime, so collect them before it is gone
+                screen_size = self.screen().size()
+                cache_keys = [
+                    uniq_file_id(path_to_delete),
+                    uniq_file_id(path_to_delete, f"{screen_size.width()}x{screen_size.height()}"),
+                    uniq_file_id(path_to_delete, f"{self.preview_image_label.width()}x{self.preview_image_label.height()}"),
+                    uniq_file_id(path_to_delete, self.gallery_thumbnail_max_size),
+                ]
+                try:
+                    os.remove(path_to_delete)
+                except FileNotFoundError:
+                    pass
+                drop_cached_images([key for key in cache_keys if key is not None])
                 self.preview_image_label.clear()
+                self._last_displayed = None
+                self._preview_pixmap = None
+                self._preview_pixmap_path = None
                 self.current_image_path = None
                 self.gallery_current_selection = None
-                self._load_images()
+                self.gallery_grid.remove_file(path_to_delete)
             except Exception as e:
                 custom_message_dialog(self, "Deletion Error", f"Failed to delete: {e}", font=self.main_font)
 
@@ -2302,17 +2717,24 @@ class WallpaperApp(QMainWindow):
         if not self.current_image_path:
             custom_message_dialog(self, "Wallpaper Error", "No image selected.", font=self.main_font)
             return
-        set_wallpaper(self.current_image_path)
+        def error_dialog(title, message):
+            self.error_occurred.emit(title, message)
+        self._wallpaper_executor.submit(set_wallpaper, self.current_image_path, error_dialog)
 
     def closeEvent(self, event):
         for d in list(self._open_picker_dialogs):
             d.close()
+        self._prompt_history_save_timer.stop()
         self._save_prompt_history()
         self.save_app_settings()
         if hasattr(self, '_gallery_watcher'):
             self._gallery_watcher.stop_watching()
         if hasattr(self, 'gallery_grid'):
             self.gallery_grid.shutdown()
+        self._generation_running = False
+        self._generation_queue.put(None)
+        self._preview_executor.shutdown(wait=False, cancel_futures=True)
+        self._wallpaper_executor.shutdown(wait=False, cancel_futures=True)
         event.accept()
 
 